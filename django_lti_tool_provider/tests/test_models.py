@@ -60,11 +60,10 @@ class LtiUserDataTest(TestCase):
 
 
 class LtiUserDataDatabaseTest(TestCase):
-    fixtures = ['test_lti_db.yaml']
-
-    def setUp(self):
-        self.user1 = User.objects.get(username='test1')
-        self.user2 = User.objects.get(username='test2')
+    @classmethod
+    def setUpTestData(cls):
+        cls.user1 = User.objects.create(username='test1', email='test@test.com')
+        cls.user2 = User.objects.create(username='test2', email='other@test.com')
 
     def test_user_and_custom_key_uniqueness(self):
         LtiUserData.objects.create(user=self.user1)  # works
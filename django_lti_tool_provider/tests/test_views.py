@@ -1,15 +1,19 @@
+import copy
+
 import ddt
 from django.contrib.auth import login, authenticate
 from importlib import import_module
 from django_lti_tool_provider import AbstractApplicationHookManager
 from mock import patch, Mock
+from six.moves.urllib.parse import urlencode
 
 from oauth2 import Request, Consumer, SignatureMethod_HMAC_SHA1
 
 from django.contrib.auth.models import User
 from django.test.utils import override_settings
-from django.test import Client, TestCase, RequestFactory
+from django.test import Client, SimpleTestCase, TestCase, RequestFactory
 from django.conf import settings
+from django.http import SimpleCookie
 
 from django_lti_tool_provider.models import LtiUserData
 from django_lti_tool_provider.views import LTIView
@@ -17,9 +21,10 @@ from django_lti_tool_provider.views import LTIView
 
 @override_settings(
     LTI_CLIENT_KEY='qertyuiop1234567890!@#$%^&*()_+[];',
-    LTI_CLIENT_SECRET='1234567890!@#$%^&*()_+[];./,;qwertyuiop'
+    LTI_CLIENT_SECRET='1234567890!@#$%^&*()_+[];./,;qwertyuiop',
+    SESSION_ENGINE='django.contrib.sessions.backends.cache'
 )
-class LtiRequestsTestBase(TestCase):
+class LtiRequestsTestBase(SimpleTestCase):
     _data = {
         "lis_result_sourcedid": "lis_result_sourcedid",
         "context_id": "LTIX/LTI-101/now",
@@ -36,40 +41,96 @@ class LtiRequestsTestBase(TestCase):
 
     DEFAULT_REDIRECT = '/home'
 
+    _HOOK_NAMES = (
+        'authentication_hook', 'authenticated_redirect_to', 'anonymous_redirect_to', 'vary_by_key',
+        'optional_lti_parameters'
+    )
+
+    @classmethod
+    def setUpClass(cls):
+        super(LtiRequestsTestBase, cls).setUpClass()
+        # oauth2 puts random nonce and current timestamp into every request; fixing them for the duration of the class
+        # makes signatures reproducible. Timestamp still has to be recent to pass the view's expiry check.
+        cls._oauth_patchers = [
+            patch.object(Request, 'make_nonce', return_value='test_nonce'),
+            patch.object(Request, 'make_timestamp', return_value=Request.make_timestamp()),
+        ]
+        for patcher in cls._oauth_patchers:
+            patcher.start()
+        # Signing is deterministic for the default payload within a test class, so it is only done once per class,
+        # up front - ddt-expanded tests then all get the same cached payload
+        req = cls._get_signed_oauth_request('/lti/', 'POST')
+        cls._CORRECT_PAYLOAD = cls._to_postdata(req)
+        # The view only has to reject the signature, so the same request with the signature replaced will do
+        req['oauth_signature'] = 'broken'
+        cls._INCORRECT_PAYLOAD = cls._to_postdata(req)
+        cls._client_template = Client()
+        cls.hook_manager = Mock(spec=AbstractApplicationHookManager)
+        LTIView.register_authentication_manager(cls.hook_manager)
+
+    @classmethod
+    def tearDownClass(cls):
+        LTIView.authentication_manager = None
+        for patcher in cls._oauth_patchers:
+            patcher.stop()
+        super(LtiRequestsTestBase, cls).tearDownClass()
+
     def setUp(self):
-        self.client = Client()
-        self.hook_manager = Mock(spec=AbstractApplicationHookManager)
-        self.hook_manager.vary_by_key = Mock(return_value=None)
-        self.hook_manager.optional_lti_parameters = Mock(return_value={})
-        LTIView.register_authentication_manager(self.hook_manager)
-
-    @property
-    def consumer(self):
+        self.client = self._make_client()
+        # Hook manager is shared by all tests in the class, so whatever previous test configured is dropped here
+        for hook_name in self._HOOK_NAMES:
+            getattr(self.hook_manager, hook_name).reset_mock(return_value=True, side_effect=True)
+        self.hook_manager.vary_by_key.return_value = None
+        self.hook_manager.optional_lti_parameters.return_value = {}
+
+    def _make_client(self):
+        client = copy.copy(self._client_template)
+        client.cookies = SimpleCookie()
+        return client
+
+    @classmethod
+    def _get_consumer(cls):
         return Consumer(settings.LTI_CLIENT_KEY, settings.LTI_CLIENT_SECRET)
 
-    def _get_signed_oauth_request(self, path, method, data=None):
-        data = data if data is not None else self._data
-        url = self._url_base + path
+    @classmethod
+    def _get_oauth_request(cls, path, method, data=None):
+        data = data if data is not None else cls._data
+        url = cls._url_base + path
         method = method if method else 'GET'
-        req = Request.from_consumer_and_token(self.consumer, {}, method, url, data)
-        req.sign_request(SignatureMethod_HMAC_SHA1(), self.consumer, None)
+        return Request.from_consumer_and_token(cls._get_consumer(), {}, method, url, data)
+
+    @classmethod
+    def _get_signed_oauth_request(cls, path, method, data=None):
+        req = cls._get_oauth_request(path, method, data)
+        req.sign_request(SignatureMethod_HMAC_SHA1(), cls._get_consumer(), None)
         return req
 
+    @staticmethod
+    def _to_postdata(parameters):
+        # Same output as oauth2.Request.to_postdata for plain str parameters, without its per-item utf-8 re-encoding;
+        # sorted so that payloads built from the same parameters are identical
+        return urlencode(sorted(parameters.items()), True).replace('+', '%20')
+
     def get_correct_lti_payload(self, path='/lti/', method='POST', data=None):
-        req = self._get_signed_oauth_request(path, method, data)
-        return req.to_postdata()
+        if (path, method, data) == ('/lti/', 'POST', None):
+            return self._CORRECT_PAYLOAD
+        return self._to_postdata(self._get_signed_oauth_request(path, method, data))
 
     def get_incorrect_lti_payload(self, path='/lti/', method='POST', data=None):
-        req = self._get_signed_oauth_request(path, method, data)
-        req['oauth_signature'] += '_broken'
-        return req.to_postdata()
+        if (path, method, data) == ('/lti/', 'POST', None):
+            return self._INCORRECT_PAYLOAD
+        # The view only has to reject the signature, so there is no point in actually computing it
+        req = self._get_oauth_request(path, method, data)
+        req['oauth_signature_method'] = SignatureMethod_HMAC_SHA1.name
+        req['oauth_signature'] = 'broken'
+        return self._to_postdata(req)
 
     def send_lti_request(self, payload, client=None):
         client = client or self.client
         return client.post('/lti/', payload, content_type='application/x-www-form-urlencoded')
 
     def _authenticate(self, username='test'):
-        self.client = Client()
+        self.client = self._make_client()
         user = User.objects.get(username=username)
         logged_in = self.client.login(username=username, password='test')
         self.assertTrue(logged_in)
@@ -79,8 +140,7 @@ class LtiRequestsTestBase(TestCase):
         self.client.logout()
 
     def _verify_redirected_to(self, response, expected_url):
-        self.assertEqual(response.status_code, 302)
-        self.assertEqual(response.url, expected_url)
+        self.assertRedirects(response, expected_url, fetch_redirect_response=False)
 
     def _verify_session_lti_contents(self, session, expected):
         self.assertIn('lti_parameters', session)
@@ -95,14 +155,14 @@ class LtiRequestsTestBase(TestCase):
         lti_data = LtiUserData.objects.get(user=user, custom_key=key)
         self.assertIsNotNone(lti_data)
         self.assertEqual(lti_data.custom_key, key)
-        for key, value in expected_lti_data.items():
-            self.assertEqual(value, lti_data.edx_lti_parameters[key])
+        self._verify_lti_data(lti_data.edx_lti_parameters, expected_lti_data)
 
 
+# Anonymous LTI requests never touch the DB, so these tests don't need TestCase's per-test transactions
 class AnonymousLtiRequestTests(LtiRequestsTestBase):
     def setUp(self):
         super(AnonymousLtiRequestTests, self).setUp()
-        self.hook_manager.anonymous_redirect_to = Mock(return_value=self.DEFAULT_REDIRECT)
+        self.hook_manager.anonymous_redirect_to.return_value = self.DEFAULT_REDIRECT
 
     def test_given_incorrect_payload_throws_bad_request(self):
         response = self.send_lti_request(self.get_incorrect_lti_payload())
@@ -118,8 +178,7 @@ class AnonymousLtiRequestTests(LtiRequestsTestBase):
 
 
 @ddt.ddt
-@patch('django_lti_tool_provider.views.Signals.LTI.received.send')
-class AuthenticatedLtiRequestTests(LtiRequestsTestBase):
+class AuthenticatedLtiRequestTests(LtiRequestsTestBase, TestCase):
     def _authentication_hook(self, request, user_id=None, username=None, email=None, **kwargs):
         user = User.objects.create_user(username or user_id, password='1234', email=email)
         user.save()
@@ -129,34 +188,31 @@ class AuthenticatedLtiRequestTests(LtiRequestsTestBase):
 
     def setUp(self):
         super(AuthenticatedLtiRequestTests, self).setUp()
-        self.hook_manager.authenticated_redirect_to = Mock(return_value=self.DEFAULT_REDIRECT)
-        self.hook_manager.authentication_hook = self._authentication_hook
+        self.hook_manager.authenticated_redirect_to.return_value = self.DEFAULT_REDIRECT
+        self.hook_manager.authentication_hook.side_effect = self._authentication_hook
+        send_patcher = patch('django_lti_tool_provider.views.Signals.LTI.received.send')
+        self.patched_send_lti_received = send_patcher.start()
+        self.addCleanup(send_patcher.stop)
 
-    def _verify_lti_updated_signal_is_sent(self, patched_send_lti_received, expected_user):
+    def _verify_lti_updated_signal_is_sent(self, expected_user):
         expected_lti_data = LtiUserData.objects.get(user=expected_user)
-        patched_send_lti_received.assert_called_once_with(LTIView, user=expected_user, lti_data=expected_lti_data)
+        self.patched_send_lti_received.assert_called_once_with(LTIView, user=expected_user, lti_data=expected_lti_data)
 
-    def test_no_session_given_incorrect_payload_throws_bad_request(self, _):
+    def test_no_session_given_incorrect_payload_throws_bad_request(self):
         response = self.send_lti_request(self.get_incorrect_lti_payload())
         self.assertEqual(response.status_code, 400)
         self.assertIn("Invalid LTI Request", response.content)
 
-    def test_no_session_correct_payload_processes_lti_request(self, patched_send_lti_received):
-        # Precondition check
-        self.assertFalse(LtiUserData.objects.all())
-
+    def test_no_session_correct_payload_processes_lti_request(self):
         response = self.send_lti_request(self.get_correct_lti_payload())
 
         # Should have been created.
         user = User.objects.all()[0]
         self._verify_lti_created(user, self._data)
         self._verify_redirected_to(response, self.DEFAULT_REDIRECT)
-        self._verify_lti_updated_signal_is_sent(patched_send_lti_received, user)
-
-    def test_given_session_and_lti_uses_lti(self, patched_send_lti_received):
-        # Precondition check
-        self.assertFalse(LtiUserData.objects.all())
+        self._verify_lti_updated_signal_is_sent(user)
 
+    def test_given_session_and_lti_uses_lti(self):
         session = self.client.session
         session['lti_parameters'] = {}
         session.save()
@@ -167,9 +223,9 @@ class AuthenticatedLtiRequestTests(LtiRequestsTestBase):
         user = User.objects.all()[0]
         self._verify_lti_created(user, self._data)
         self._verify_redirected_to(response, self.DEFAULT_REDIRECT)
-        self._verify_lti_updated_signal_is_sent(patched_send_lti_received, user)
+        self._verify_lti_updated_signal_is_sent(user)
 
-    def test_force_login_change(self, patched_send_lti_received):
+    def test_force_login_change(self):
         self.assertFalse(User.objects.exclude(id=1))
         payload = self.get_correct_lti_payload()
         request = self.send_lti_request(payload, client=RequestFactory())
@@ -199,14 +255,13 @@ class AuthenticatedLtiRequestTests(LtiRequestsTestBase):
         self.assertEqual(LtiUserData.objects.all().count(), 1)
 
 @ddt.ddt
-class AuthenticationManagerIntegrationTests(LtiRequestsTestBase):
+class AuthenticationManagerIntegrationTests(LtiRequestsTestBase, TestCase):
     TEST_URLS = "/some_url", "/some_other_url", "http://qwe.asd.zxc.com"
 
     def setUp(self):
         super(AuthenticationManagerIntegrationTests, self).setUp()
 
     def tearDown(self):
-        LTIView.authentication_manager = None
         self._logout()
 
     def _authenticate_user(self, request, user_id=None, username=None, email=None, **kwargs):
@@ -13,6 +13,8 @@ settings.configure(
     DATABASES={
         'default': {
             'ENGINE': 'django.db.backends.sqlite3',
+            # Test database lives in memory, so there is nothing to create/drop on disk (and nothing for --keepdb to keep)
+            'NAME': ':memory:',
         }
     },
     SITE_ID=1,
@@ -42,6 +44,8 @@ settings.configure(
         }
     ],
     USE_TZ=True,
+    # Tests create and log in users a lot, and default PBKDF2 hasher is deliberately slow
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
     SOUTH_TESTS_MIGRATE=True,
     LTI_CLIENT_KEY='lti_client_key',
     LTI_CLIENT_SECRET='lti_client_secret',
@@ -54,4 +58,7 @@ if __name__ == "__main__":
     if not paths:
         paths = ["django_lti_tool_provider/tests"]
     options = [arg for arg in args if arg not in paths]
+    if not any(option.startswith('--parallel') for option in options):
+        # Test cases don't share any state, so spread them across all available cores unless told otherwise
+        options.append('--parallel')
     execute_from_command_line([sys.argv[0], "test"] + paths + options)